@@ -1,38 +1,154 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+
+import orjson
+from fastapi import Depends, FastAPI, Header, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
-from pydantic import BaseModel
+from fastapi.responses import HTMLResponse, FileResponse, ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, PrivateAttr, field_validator, model_validator
+from pydantic_core import PydanticCustomError
 import re
-from typing import Optional
+from typing import Any, Optional
 
 from rgbYoutube import (
     process_youtube_video,
     process_multiple_youtube_videos,
     add_video_to_existing,
-    remove_video_and_rebuild,
-    query_rag_chain
+    remove_video_chunks,
+    retrieve_context,
+    stream_answer,
+    embed_question,
+    save_vectorstore,
+    load_vectorstore
 )
+from clients import EMBEDDINGS_MODEL
+from semantic_cache import SemanticCache
 
-app = FastAPI(title="YouTube Chat AI")
 
-# In-memory storage for the current RAG chain and transcripts
-# In production, you'd want to use proper session management
-current_rag_chain = None
-current_transcripts = {}  # Maps video_id -> transcript_text
-current_video_ids = []  # List of loaded video IDs in order
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Transcript download, embeddings and LLM calls are blocking and run via
+    # asyncio.to_thread; a larger default pool lets more of them overlap
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=32))
+    yield
+
+
+app = FastAPI(title="YouTube Chat AI", lifespan=lifespan, default_response_class=ORJSONResponse)
+
+SESSIONS_DIR = "sessions"
+SESSION_IDLE_TIMEOUT = 30 * 60  # Seconds before an unused session is dropped from memory
+MAX_SESSIONS = 256  # Sessions kept in memory at once; dropped ones reload from disk
+
+
+@dataclass
+class SessionState:
+    session_id: str
+    vectorstore: Any = None  # FAISS store answers are retrieved from; None until videos are loaded
+    transcripts: dict = field(default_factory=dict)  # Maps video_id -> transcript_text
+    video_ids: list = field(default_factory=list)  # List of loaded video IDs in order
+    video_chunk_ids: dict = field(default_factory=dict)  # Maps video_id -> vector store IDs of its chunks
+    last_used: float = field(default_factory=time.monotonic)  # For idle eviction
+    # Serializes load/add/remove so concurrent requests can't interleave updates.
+    # Add/remove mutate the FAISS index in place, so /chat holds it while searching
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+# In-memory sessions, keyed by the X-Session-Id header, least recently used
+# first; each one is also saved under SESSIONS_DIR so it survives a restart
+# and can be evicted from memory
+SESSIONS: OrderedDict[str, SessionState] = OrderedDict()
+_sessions_lock = threading.Lock()
+_session_load_locks: dict[str, threading.Lock] = {}  # session_id -> lock held while it loads from disk
+
+# Answers to previous questions, keyed by the set of loaded videos, shared
+# by every session that has the same videos loaded
+answer_cache = SemanticCache()
+
+
+# Compiled once at import; a single alternation covers watch?v=, watch?...&v=,
+# embed/ and youtu.be/ links so each URL is scanned only once
+_YT_ID_RE = re.compile(r'(?:youtube\.com/(?:watch\?(?:[^#]*&)?v=|embed/)|youtu\.be/)([A-Za-z0-9_-]{11})')
+_BARE_ID_RE = re.compile(r'^[A-Za-z0-9_-]{11}$')
+_SESSION_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
 
 
 class VideoRequest(BaseModel):
-    urls: list[str]  # Changed to support multiple URLs
+    urls: Optional[list[str]] = None  # Changed to support multiple URLs
+    url: Optional[str] = None  # Single URL, as accepted before multi-video support
+
+    # Filled in once at validation time
+    _video_ids: list[str] = PrivateAttr(default_factory=list)
+    _invalid_urls: list[str] = PrivateAttr(default_factory=list)
+
+    @model_validator(mode="after")
+    def _extract_video_ids(self):
+        if self.urls is None:
+            self.urls = [self.url] if self.url else []
+        if not self.urls:
+            raise PydanticCustomError("no_urls", "Please provide at least one YouTube URL.")
+
+        for url in self.urls:
+            video_id = extract_video_id(url.strip())
+            if not video_id:
+                self._invalid_urls.append(url)
+            elif video_id not in self._video_ids:
+                # Different URLs for the same video are fetched and embedded once
+                self._video_ids.append(video_id)
+
+        if not self._video_ids:
+            raise PydanticCustomError(
+                "no_valid_urls",
+                "No valid YouTube URLs found. Invalid URLs: {invalid_urls}",
+                {"invalid_urls": ", ".join(self._invalid_urls)}
+            )
+        return self
+
+    @property
+    def video_ids(self) -> list[str]:
+        return self._video_ids
+
+    @property
+    def invalid_urls(self) -> list[str]:
+        return self._invalid_urls
 
 
 class AddVideoRequest(BaseModel):
     url: str  # Single URL to add
 
+    _video_id: str = PrivateAttr()
+
+    @model_validator(mode="after")
+    def _extract_video_id(self):
+        video_id = extract_video_id(self.url.strip())
+        if not video_id:
+            raise PydanticCustomError("invalid_youtube_url", "Invalid YouTube URL.")
+        self._video_id = video_id
+        return self
+
+    @property
+    def video_id(self) -> str:
+        return self._video_id
+
 
 class RemoveVideoRequest(BaseModel):
     video_id: str  # Video ID to remove
 
+    @field_validator("video_id")
+    @classmethod
+    def _check_video_id(cls, value: str) -> str:
+        if not _BARE_ID_RE.match(value):
+            raise PydanticCustomError("invalid_video_id", "Invalid video ID.")
+        return value
+
 
 class ChatRequest(BaseModel):
     question: str
@@ -45,188 +161,316 @@ def extract_video_id(url: str) -> Optional[str]:
     - https://youtu.be/VIDEO_ID
     - https://www.youtube.com/embed/VIDEO_ID
     """
-    patterns = [
-        r'(?:youtube\.com\/watch\?v=|youtu\.be\/|youtube\.com\/embed\/)([a-zA-Z0-9_-]{11})',
-        r'(?:youtube\.com\/.*[?&]v=)([a-zA-Z0-9_-]{11})',
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
+    match = _YT_ID_RE.search(url)
+    if match:
+        return match.group(1)
 
     # If it's already just the video ID (11 characters)
-    if re.match(r'^[a-zA-Z0-9_-]{11}$', url):
-        return url
+    return url if _BARE_ID_RE.match(url) else None
 
-    return None
 
+def session_key(session: SessionState) -> tuple:
+    """Key identifying the set of videos loaded in a session"""
+    return tuple(sorted(session.video_ids))
 
-@app.get("/", response_class=HTMLResponse)
-async def read_root():
-    """Serve the main HTML page"""
-    return FileResponse("static/index.html")
 
+def sse_event(data: dict) -> str:
+    """Format one Server-Sent Events message"""
+    return f"data: {orjson.dumps(data).decode()}\n\n"
 
-@app.post("/process-video")
-async def process_video(request: VideoRequest):
+
+def save_session(session: SessionState):
     """
-    Process one or more YouTube video URLs and build a unified RAG chain
+    Write a session's vector store and state to SESSIONS_DIR/<session_id>.
+    Each save writes the index to a new subdirectory, then atomically
+    replaces state.json to point at it, so a crash part-way leaves the
+    previous save intact rather than an index that doesn't match the state.
     """
-    global current_rag_chain, current_transcripts, current_video_ids
+    session_dir = os.path.join(SESSIONS_DIR, session.session_id)
+    index_dir = uuid.uuid4().hex
+    save_vectorstore(session.vectorstore, os.path.join(session_dir, index_dir))
+
+    state = {
+        "transcripts": session.transcripts,
+        "video_ids": session.video_ids,
+        "video_chunk_ids": session.video_chunk_ids,
+        "embeddings_model": EMBEDDINGS_MODEL,
+        "index_dir": index_dir
+    }
+    state_path = os.path.join(session_dir, "state.json")
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, state_path)
+
+    # Only now are older indexes (and any left by an interrupted save) unreferenced
+    for name in os.listdir(session_dir):
+        if name in (index_dir, "state.json"):
+            continue
+        path = os.path.join(session_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
 
-    if not request.urls or len(request.urls) == 0:
-        raise HTTPException(
-            status_code=400,
-            detail="Please provide at least one YouTube URL."
-        )
 
-    # Extract video IDs from all URLs
-    video_ids = []
-    invalid_urls = []
+def load_session(session_id: str) -> SessionState:
+    """
+    Restore a session saved by save_session, or start an empty one if there
+    is no usable save (missing, damaged, or from another embeddings model).
+    """
+    session = SessionState(session_id=session_id)
+    session_dir = os.path.join(SESSIONS_DIR, session_id)
+    state_path = os.path.join(session_dir, "state.json")
+
+    if not os.path.exists(state_path):
+        return session
+
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+
+        # Vectors from another embeddings model can't be searched with this one,
+        # so the session starts over (older states didn't record the model)
+        if state.get("embeddings_model", EMBEDDINGS_MODEL) != EMBEDDINGS_MODEL:
+            return session
+
+        # Saves from before index subdirectories kept the index next to state.json
+        vectorstore = load_vectorstore(os.path.join(session_dir, state.get("index_dir", "")))
+        transcripts = state["transcripts"]
+        video_ids = state["video_ids"]
+        video_chunk_ids = state["video_chunk_ids"]
+    except Exception:
+        return session
+
+    # The index must hold exactly the recorded chunks, or later removals fail
+    recorded_ids = {chunk_id for ids in video_chunk_ids.values() for chunk_id in ids}
+    if not (set(video_ids) == set(transcripts) == set(video_chunk_ids)
+            and recorded_ids == set(vectorstore.index_to_docstore_id.values())):
+        return session
+
+    session.vectorstore = vectorstore
+    session.transcripts = transcripts
+    session.video_ids = video_ids
+    session.video_chunk_ids = video_chunk_ids
+    return session
+
+
+async def persist_session(session: SessionState):
+    """
+    Save a session after a change. If saving fails, the in-memory session is
+    put back to its last successful save (which the failed save left intact)
+    so memory and disk don't drift apart, and a 500 is raised.
+    """
+    try:
+        await asyncio.to_thread(save_session, session)
+    except Exception as e:
+        saved = await asyncio.to_thread(load_session, session.session_id)
+        session.vectorstore = saved.vectorstore
+        session.transcripts = saved.transcripts
+        session.video_ids = saved.video_ids
+        session.video_chunk_ids = saved.video_chunk_ids
+        raise HTTPException(status_code=500, detail=f"Failed to save session: {str(e)}")
+
+
+def _evict_sessions():
+    """
+    Drop sessions idle for SESSION_IDLE_TIMEOUT, or the least recently used
+    beyond MAX_SESSIONS, skipping any still serving a request.
+    Their state is already on disk. Caller holds _sessions_lock.
+    """
+    now = time.monotonic()
+    for session_id in list(SESSIONS)[:-1]:  # Never the session just used
+        session = SESSIONS[session_id]
+        if len(SESSIONS) <= MAX_SESSIONS and now - session.last_used < SESSION_IDLE_TIMEOUT:
+            break  # Oldest first, so every later session is newer
+        if not session.lock.locked():
+            del SESSIONS[session_id]
+
+
+def _use_session(session: SessionState) -> SessionState:
+    """Mark a session as just used. Caller holds _sessions_lock."""
+    session.last_used = time.monotonic()
+    SESSIONS.move_to_end(session.session_id)
+    _evict_sessions()
+    return session
+
+
+def get_session(x_session_id: str = Header(...)) -> SessionState:
+    """Dependency resolving the X-Session-Id header to its session"""
+    if not _SESSION_ID_RE.match(x_session_id):
+        raise HTTPException(status_code=400, detail="Invalid session ID.")
+
+    with _sessions_lock:
+        session = SESSIONS.get(x_session_id)
+        if session is not None:
+            return _use_session(session)
+        load_lock = _session_load_locks.setdefault(x_session_id, threading.Lock())
+
+    # Read from disk outside the global lock so other sessions aren't held up;
+    # the per-session lock makes concurrent first requests load it only once
+    with load_lock:
+        with _sessions_lock:
+            session = SESSIONS.get(x_session_id)
+            if session is not None:
+                return _use_session(session)
+
+        try:
+            session = load_session(x_session_id)
+        except Exception:
+            with _sessions_lock:
+                _session_load_locks.pop(x_session_id, None)
+            raise
+
+        with _sessions_lock:
+            _session_load_locks.pop(x_session_id, None)
+            return _use_session(SESSIONS.setdefault(x_session_id, session))
 
-    for url in request.urls:
-        video_id = extract_video_id(url.strip())
-        if video_id:
-            video_ids.append(video_id)
-        else:
-            invalid_urls.append(url)
 
-    if not video_ids:
-        raise HTTPException(
-            status_code=400,
-            detail=f"No valid YouTube URLs found. Invalid URLs: {', '.join(invalid_urls)}"
-        )
+@app.get("/", response_class=HTMLResponse)
+async def read_root():
+    """Serve the main HTML page"""
+    return FileResponse("static/index.html")
 
-    # Process all videos and build unified RAG chain
-    rag_chain, successful_videos, failed_videos, transcripts_dict = process_multiple_youtube_videos(video_ids)
 
-    if rag_chain is None:
-        error_details = "; ".join([f"{v['video_id']}: {v['error']}" for v in failed_videos])
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to process videos. Errors: {error_details}"
+@app.post("/process-video")
+async def process_video(request: VideoRequest, session: SessionState = Depends(get_session)):
+    """
+    Process one or more YouTube video URLs into a shared vector store
+    """
+    async with session.lock:
+        # Process all videos into one vector store
+        vectorstore, chunk_ids, successful_videos, failed_videos, transcripts_dict = await asyncio.to_thread(
+            process_multiple_youtube_videos, request.video_ids
         )
 
-    # Store the RAG chain and transcripts for this session
-    current_rag_chain = rag_chain
-    current_transcripts = transcripts_dict
-    current_video_ids = successful_videos
+        if vectorstore is None:
+            # Pipeline-wide failures (e.g. embedding) aren't tied to one video
+            error_details = "; ".join([
+                f"{v['video_id']}: {v['error']}" if "video_id" in v else v["error"]
+                for v in failed_videos
+            ])
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to process videos. Errors: {error_details}"
+            )
+
+        # Store the vector store and transcripts for this session
+        session.vectorstore = vectorstore
+        session.transcripts = transcripts_dict
+        session.video_ids = successful_videos
+        session.video_chunk_ids = chunk_ids
+        await persist_session(session)
 
     return {
         "success": True,
         "message": f"Processed {len(successful_videos)} video(s) successfully!",
         "video_ids": successful_videos,
         "failed_videos": failed_videos,
-        "invalid_urls": invalid_urls
+        "invalid_urls": request.invalid_urls
     }
 
 
 @app.post("/add-video")
-async def add_video(request: AddVideoRequest):
+async def add_video(request: AddVideoRequest, session: SessionState = Depends(get_session)):
     """
     Add a single video to the existing session
     """
-    global current_rag_chain, current_transcripts, current_video_ids
-
-    if current_rag_chain is None:
-        raise HTTPException(
-            status_code=400,
-            detail="No initial videos loaded. Please load videos first."
-        )
+    video_id = request.video_id
 
-    # Extract video ID from URL
-    video_id = extract_video_id(request.url.strip())
-    if not video_id:
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid YouTube URL."
+    async with session.lock:
+        if session.vectorstore is None:
+            raise HTTPException(
+                status_code=400,
+                detail="No initial videos loaded. Please load videos first."
+            )
+
+        # Check if video already loaded
+        if video_id in session.video_ids:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Video {video_id} is already loaded."
+            )
+
+        # Add video to existing transcripts and vector store
+        success, error, updated_transcripts, new_chunk_ids = await asyncio.to_thread(
+            add_video_to_existing, session.vectorstore, session.transcripts, video_id
         )
 
-    # Check if video already loaded
-    if video_id in current_video_ids:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Video {video_id} is already loaded."
-        )
-
-    # Add video to existing transcripts
-    rag_chain, success, error, updated_transcripts = add_video_to_existing(
-        current_transcripts, video_id
-    )
-
-    if not success:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to add video: {error}"
-        )
+        if not success:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to add video: {error}"
+            )
 
-    # Update session storage
-    current_rag_chain = rag_chain
-    current_transcripts = updated_transcripts
-    current_video_ids.append(video_id)
+        # Update session storage
+        session.transcripts = updated_transcripts
+        session.video_ids.append(video_id)
+        session.video_chunk_ids[video_id] = new_chunk_ids
+        await persist_session(session)
 
     return {
         "success": True,
         "message": f"Video {video_id} added successfully!",
         "video_id": video_id,
-        "video_ids": current_video_ids
+        "video_ids": session.video_ids
     }
 
 
 @app.post("/remove-video")
-async def remove_video(request: RemoveVideoRequest):
+async def remove_video(request: RemoveVideoRequest, session: SessionState = Depends(get_session)):
     """
     Remove a video from the existing session
     """
-    global current_rag_chain, current_transcripts, current_video_ids
-
-    if current_rag_chain is None:
-        raise HTTPException(
-            status_code=400,
-            detail="No videos loaded."
-        )
-
     video_id = request.video_id
 
-    if video_id not in current_video_ids:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Video {video_id} not found in session."
+    async with session.lock:
+        if session.vectorstore is None:
+            raise HTTPException(
+                status_code=400,
+                detail="No videos loaded."
+            )
+
+        if video_id not in session.video_ids:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Video {video_id} not found in session."
+            )
+
+        # Remove video from transcripts and vector store
+        updated_transcripts, error = await asyncio.to_thread(
+            remove_video_chunks, session.vectorstore, session.transcripts, video_id,
+            session.video_chunk_ids[video_id]
         )
 
-    # Remove video and rebuild
-    rag_chain, updated_transcripts, error = remove_video_and_rebuild(
-        current_transcripts, video_id
-    )
+        if error:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to remove video: {error}"
+            )
 
-    if error:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to remove video: {error}"
-        )
-
-    # Update session storage
-    current_rag_chain = rag_chain
-    current_transcripts = updated_transcripts
-    current_video_ids.remove(video_id)
+        # Update session storage
+        session.transcripts = updated_transcripts
+        session.video_ids.remove(video_id)
+        del session.video_chunk_ids[video_id]
+        await persist_session(session)
 
     return {
         "success": True,
         "message": f"Video {video_id} removed successfully!",
         "video_id": video_id,
-        "video_ids": current_video_ids
+        "video_ids": session.video_ids
     }
 
 
 @app.post("/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, session: SessionState = Depends(get_session)):
     """
-    Send a question and get an AI response based on the current video
+    Send a question and stream the AI response based on the current video
+    as Server-Sent Events: {"token": ...} messages followed by {"done": true},
+    or {"error": ...} if generation fails part-way
     """
-    global current_rag_chain
-
-    if current_rag_chain is None:
+    if session.vectorstore is None:
         raise HTTPException(
             status_code=400,
             detail="No video has been processed yet. Please provide a YouTube URL first."
@@ -235,16 +479,45 @@ async def chat(request: ChatRequest):
     if not request.question.strip():
         raise HTTPException(status_code=400, detail="Question cannot be empty")
 
-    # Query the RAG chain
-    answer, error = query_rag_chain(current_rag_chain, request.question)
+    embedding, _ = await asyncio.to_thread(embed_question, request.question)
+
+    async def token_stream():
+        # Only the cache lookup and index search need the session lock; the
+        # answer is generated after releasing it, so other questions and
+        # adds/removes don't wait for the model or a slow reader
+        try:
+            async with session.lock:
+                # Serve repeated or rephrased questions from the cache
+                key = session_key(session)
+                answer = answer_cache.lookup(embedding, key) if embedding is not None else None
+
+                if answer is None:
+                    context = await asyncio.to_thread(
+                        retrieve_context, session.vectorstore, request.question, embedding
+                    )
+        except Exception as e:
+            yield sse_event({"error": f"Error while querying: {str(e)}"})
+            return
+
+        if answer is not None:
+            yield sse_event({"token": answer})
+        else:
+            # Stream the answer as it is generated
+            parts = []
+            try:
+                async for chunk in stream_answer(request.question, context):
+                    parts.append(chunk)
+                    yield sse_event({"token": chunk})
+            except Exception as e:
+                yield sse_event({"error": f"Error while querying: {str(e)}"})
+                return
 
-    if error:
-        raise HTTPException(status_code=500, detail=error)
+            if embedding is not None:
+                answer_cache.insert(embedding, request.question, "".join(parts), key)
 
-    return {
-        "answer": answer,
-        "question": request.question
-    }
+        yield sse_event({"done": True})
+
+    return StreamingResponse(token_stream(), media_type="text/event-stream")
 
 
 @app.get("/health")
@@ -252,7 +525,7 @@ async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "video_loaded": current_rag_chain is not None
+        "active_sessions": len(SESSIONS)
     }
 
 
@@ -261,7 +534,17 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
     print("Starting YouTube Chat AI server...")
     print("Open your browser at: http://localhost:8000")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # uvloop and the httptools parser are C implementations of the event loop
+    # and HTTP parsing; uvloop has no Windows support, so fall back there.
+    # A single worker: sessions and the answer cache live in this process
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools"
+    )
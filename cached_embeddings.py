@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from langchain_classic.embeddings import CacheBackedEmbeddings
+from langchain_classic.storage import LocalFileStore
+from langchain_openai import OpenAIEmbeddings
+from pydantic import PrivateAttr
+
+
+class CachedOpenAIEmbeddings(OpenAIEmbeddings):
+    """
+    OpenAIEmbeddings with an exact-match LRU cache for query embeddings.
+
+    Queries are keyed by the SHA-256 of their text, so asking the same
+    question again (including the retriever embedding a question the
+    semantic cache already embedded) costs no API call.
+    """
+
+    max_cached_queries: int = 10_000
+
+    _lru: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    _lru_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def _cache_get(self, key: bytes):
+        with self._lru_lock:
+            embedding = self._lru.get(key)
+            if embedding is not None:
+                self._lru.move_to_end(key)
+            return embedding
+
+    def _cache_put(self, key: bytes, embedding: list[float]):
+        with self._lru_lock:
+            self._lru[key] = embedding
+            self._lru.move_to_end(key)
+            if len(self._lru) > self.max_cached_queries:
+                self._lru.popitem(last=False)
+
+    def embed_query(self, text: str, **kwargs) -> list[float]:
+        key = hashlib.sha256(text.encode()).digest()
+        embedding = self._cache_get(key)
+        if embedding is None:
+            embedding = super().embed_query(text, **kwargs)
+            self._cache_put(key, embedding)
+        return embedding
+
+    async def aembed_query(self, text: str, **kwargs) -> list[float]:
+        key = hashlib.sha256(text.encode()).digest()
+        embedding = self._cache_get(key)
+        if embedding is None:
+            embedding = await super().aembed_query(text, **kwargs)
+            self._cache_put(key, embedding)
+        return embedding
+
+
+class AtomicLocalFileStore(LocalFileStore):
+    """
+    LocalFileStore that writes each value to a temp file and renames it into
+    place, so a crash or a concurrent reader never sees a half-written entry.
+    """
+
+    def mset(self, key_value_pairs) -> None:
+        for key, value in key_value_pairs:
+            full_path = self._get_full_path(key)
+            self._mkdir_for_store(full_path.parent)
+            tmp_path = full_path.with_name(f"{full_path.name}.{uuid.uuid4().hex}.tmp")
+            tmp_path.write_bytes(value)
+            if self.chmod_file is not None:
+                tmp_path.chmod(self.chmod_file)
+            os.replace(tmp_path, full_path)
+
+
+def _decode_vector(value: bytes):
+    """Decode a cached vector; a corrupt entry reads as a miss, so it is re-embedded and overwritten."""
+    try:
+        return json.loads(value)
+    except ValueError:  # Also covers UnicodeDecodeError
+        return None
+
+
+def disk_cached_embeddings(embeddings, root_path: str, namespace: str) -> CacheBackedEmbeddings:
+    """
+    Wrap embeddings so document vectors are cached under root_path, keyed by
+    namespace + the SHA-256 of the text. Query embeddings are not cached here.
+    """
+    cached = CacheBackedEmbeddings.from_bytes_store(
+        embeddings,
+        AtomicLocalFileStore(root_path),
+        namespace=namespace,
+        key_encoder="sha256"
+    )
+    cached.document_embedding_store.value_deserializer = _decode_vector
+    return cached
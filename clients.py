@@ -0,0 +1,56 @@
+from dotenv import load_dotenv
+import os
+import httpx
+
+from langchain_openai import ChatOpenAI
+
+from cached_embeddings import CachedOpenAIEmbeddings, disk_cached_embeddings
+
+
+load_dotenv()  # expects OPENAI_API_KEY in .env
+
+# One connection pool per client type, shared by the chat model and the
+# embeddings, so TLS connections to OpenAI are kept alive between requests.
+# httpx.Client is thread-safe; the async client is only used from the
+# server's event loop (async pools can't be shared between event loops).
+# Idle connections are kept for 2 minutes rather than httpx's default 5s, so
+# a CLI user typing the next question, or a quiet server, still reuses a warm
+# TLS connection; ones the server has closed meanwhile are dropped on reuse
+_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=120)
+HTTP_CLIENT = httpx.Client(limits=_LIMITS)
+HTTP_ASYNC_CLIENT = httpx.AsyncClient(limits=_LIMITS)
+
+CHAT = ChatOpenAI(
+    model="gpt-4o-mini",
+    http_client=HTTP_CLIENT,
+    http_async_client=HTTP_ASYNC_CLIENT
+)
+
+# Set LOCAL_EMBEDDINGS_MODEL (e.g. BAAI/bge-small-en-v1.5) to embed on this
+# machine instead of through the OpenAI API, so embedding a question is a
+# local forward pass rather than a network round-trip.
+# Needs: pip install langchain-huggingface sentence-transformers
+LOCAL_EMBEDDINGS_MODEL = os.getenv("LOCAL_EMBEDDINGS_MODEL")
+
+if LOCAL_EMBEDDINGS_MODEL:
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    EMBED = HuggingFaceEmbeddings(
+        model_name=LOCAL_EMBEDDINGS_MODEL,
+        model_kwargs={"device": "cpu"},
+        # Unit-length vectors, so inner-product search stays cosine similarity
+        encode_kwargs={"normalize_embeddings": True, "batch_size": 64}
+    )
+    EMBEDDINGS_MODEL = LOCAL_EMBEDDINGS_MODEL
+else:
+    EMBED = CachedOpenAIEmbeddings(
+        http_client=HTTP_CLIENT,
+        http_async_client=HTTP_ASYNC_CLIENT
+    )
+    EMBEDDINGS_MODEL = EMBED.model
+
+# Chunk embeddings are also cached on disk, keyed by the SHA-256 of the
+# chunk text, so a chunk embedded once (re-adding a video, or another
+# session over the same video) is read back instead of requested again
+EMBED_CACHE_DIR = "emb_cache"
+DOC_EMBED = disk_cached_embeddings(EMBED, EMBED_CACHE_DIR, namespace=EMBEDDINGS_MODEL)
@@ -1,70 +1,211 @@
 from dotenv import load_dotenv
+import math
 import os
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from youtube_transcript_api import YouTubeTranscriptApi
+import requests
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+from youtube_transcript_api import IpBlocked, YouTubeRequestFailed, YouTubeTranscriptApi
 
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 
+from clients import CHAT, DOC_EMBED, EMBED
+
 
 # -------- 1. Load API key --------
 load_dotenv()  # expects OPENAI_API_KEY in .env
 
 
 # -------- 2. Get YouTube transcript --------
+def _is_transient(exception: BaseException) -> bool:
+    """
+    Whether a failed fetch is worth retrying: throttling (429s raise IpBlocked),
+    YouTube 5xx errors, and dropped or timed-out connections. Bot-check blocks
+    and other 4xx responses fail the same way every time.
+    """
+    if isinstance(exception, IpBlocked):
+        return True
+    if isinstance(exception, YouTubeRequestFailed):
+        # Only the message is kept; the HTTPError it wraps is the implicit context
+        response = getattr(exception.__context__, "response", None)
+        return response is not None and response.status_code >= 500
+    return isinstance(exception, (requests.ConnectionError, requests.Timeout))
+
+
+@retry(
+    retry=retry_if_exception(_is_transient),
+    stop=stop_after_attempt(5),
+    wait=wait_exponential_jitter(initial=1, max=30),
+    reraise=True
+)
+def _fetch(video_id: str):
+    """Fetch a transcript, backing off and retrying when YouTube throttles us."""
+    ytt_api = YouTubeTranscriptApi()
+    return ytt_api.fetch(video_id, languages=['en', 'iw'])
+
+
+# Downloaded transcripts are kept on disk, so processing a video again (in a
+# later run or another session) needs no request to YouTube; together with
+# the chunk embedding cache it skips ingestion's network calls entirely
+TRANSCRIPT_CACHE_DIR = "transcript_cache"
+_CACHEABLE_ID_RE = re.compile(r'^[A-Za-z0-9_-]{11}$')  # Also keeps IDs safe to use as file names
+
+
 def get_youtube_transcript(video_id: str) -> str:
     """
     Download transcript for a given YouTube video (if available)
     and return it as a single long text.
     """
-    ytt_api = YouTubeTranscriptApi()
-    fetched = ytt_api.fetch(video_id, languages=['en', 'iw'])  
+    cacheable = bool(_CACHEABLE_ID_RE.match(video_id))
+    cache_path = os.path.join(TRANSCRIPT_CACHE_DIR, f"{video_id}.txt")
+    if cacheable and os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    fetched = _fetch(video_id)
 
     # fetched הוא FetchedTranscript - אפשר ללכת על snippet.text
-    lines = [snippet.text for snippet in fetched if snippet.text.strip()]
-    full_text = "\n".join(lines)
+    # isspace() checks for blank captions without allocating a stripped copy
+    full_text = "\n".join(snippet.text for snippet in fetched if snippet.text and not snippet.text.isspace())
+
+    if cacheable and full_text.strip():
+        # Written to a temp file and renamed so concurrent readers never see half a transcript
+        os.makedirs(TRANSCRIPT_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(full_text)
+        os.replace(tmp_path, cache_path)
+
     return full_text
 
 
-# -------- 3. Build RAG components from transcript --------
-def build_rag_from_text(text: str):
-    # Split the transcript into chunks
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=800,
-        chunk_overlap=100
+TRANSCRIPT_CONCURRENCY = 8  # Transcript downloads in flight at once
+
+
+# -------- 3. Build RAG components from transcripts --------
+EMBED_BATCH_SIZE = 256  # Max chunks per embeddings request (~50k tokens, well under the API's per-request cap)
+EMBED_CONCURRENCY = 8  # Embeddings requests in flight at once
+RETRIEVER_K = 4  # Transcript chunks given to the model per question
+
+# Built once and shared by every build: both are stateless after construction
+_SPLITTER = RecursiveCharacterTextSplitter(
+    chunk_size=800,
+    chunk_overlap=100
+)
+
+_PROMPT = ChatPromptTemplate.from_messages([
+    (
+        "system",
+        "You are an assistant that answers ONLY based on the given video transcript context. "
+        "If the answer is not in the transcript, say: 'Not found in the video transcript.'"
+    ),
+    (
+        "user",
+        "Question: {question}\n\n"
+        "Relevant transcript parts:\n{context}"
     )
-    docs = splitter.create_documents([text])
+])
 
-    # Create embeddings + vector store
-    embeddings = OpenAIEmbeddings()
-    vectorstore = Chroma.from_documents(documents=docs, embedding=embeddings)
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 4})
+# prompt -> model -> string; the same for every store, so composed once
+_ANSWER_CHAIN = _PROMPT | CHAT | StrOutputParser()
 
-    # Build RAG chain: retriever -> prompt -> model -> string
-    prompt = ChatPromptTemplate.from_messages([
-        (
-            "system",
-            "You are an assistant that answers ONLY based on the given video transcript context. "
-            "If the answer is not in the transcript, say: 'Not found in the video transcript.'"
-        ),
-        (
-            "user",
-            "Question: {question}\n\n"
-            "Relevant transcript parts:\n{context}"
-        )
-    ])
-
-    model = ChatOpenAI(model="gpt-4o-mini")
 
+def _batches(texts: list) -> list:
+    """
+    Cut texts into embedding batches, sized so even a short transcript is
+    spread over all EMBED_CONCURRENCY requests rather than sent as one.
+    """
+    batch_size = max(1, min(EMBED_BATCH_SIZE, math.ceil(len(texts) / EMBED_CONCURRENCY)))
+    return [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+
+def _embed_in_batches(embeddings, texts: list) -> list:
+    """
+    Embed texts as batches sent concurrently, returning the vectors in the
+    same order as texts.
+    Batches go through the thread-safe sync client: this runs outside the
+    server's event loop, and the shared async client is bound to that loop.
+    """
+    with ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY) as executor:
+        results = executor.map(embeddings.embed_documents, _batches(texts))
+        return [vector for batch_vectors in results for vector in batch_vectors]
+
+
+def _split_transcript(video_id: str, transcript_text: str):
+    """
+    Split one transcript into plain-text chunks (no Document round-trip).
+    Returns (chunks, metadatas, ids), each chunk tagged with video_id and
+    given a new store ID.
+    """
+    chunks = _SPLITTER.split_text(transcript_text)
+    return chunks, [{"video_id": video_id} for _ in chunks], [str(uuid.uuid4()) for _ in chunks]
+
+
+def _embed_transcripts(transcripts_dict: dict):
+    """
+    Split transcripts into chunks and embed them.
+    transcripts_dict maps video_id -> transcript_text; every chunk is tagged
+    with the video_id it came from.
+    Returns (text_embeddings, metadatas, ids, chunk_ids) ready for FAISS,
+    where chunk_ids maps video_id -> the store IDs of its chunks.
+    """
+    texts, metadatas, ids = [], [], []
+    chunk_ids = {}
+
+    for video_id, transcript_text in transcripts_dict.items():
+        chunks, video_metadatas, video_chunk_ids = _split_transcript(video_id, transcript_text)
+        texts.extend(chunks)
+        metadatas.extend(video_metadatas)
+        ids.extend(video_chunk_ids)
+        chunk_ids[video_id] = video_chunk_ids
+
+    # Embed all chunks of all videos in concurrent batches (cached chunks skip the API)
+    vectors = _embed_in_batches(DOC_EMBED, texts)
+
+    return list(zip(texts, vectors)), metadatas, ids, chunk_ids
+
+
+def build_vectorstore(transcripts_dict: dict):
+    """
+    Build an in-memory FAISS store over one or more transcripts.
+    Per-session corpora are a few hundred chunks, so an exact inner-product
+    index (OpenAI embeddings are unit length, so this is cosine) beats an
+    approximate one.
+    Returns (vectorstore, chunk_ids) where chunk_ids maps video_id -> store IDs.
+    """
+    text_embeddings, metadatas, ids, chunk_ids = _embed_transcripts(transcripts_dict)
+    return _vectorstore_from_embeddings(text_embeddings, metadatas, ids), chunk_ids
+
+
+def _vectorstore_from_embeddings(text_embeddings: list, metadatas: list, ids: list):
+    """Create a FAISS store from already-embedded chunks."""
+    return FAISS.from_embeddings(
+        text_embeddings,
+        EMBED,
+        metadatas=metadatas,
+        ids=ids,
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+    )
+
+
+def build_rag_chain(vectorstore):
+    """
+    Build the RAG chain over a vector store. The chain keeps a reference to
+    the store, so later adds/deletes on it are visible without rebuilding.
+    """
+    retriever = vectorstore.as_retriever(search_kwargs={"k": RETRIEVER_K})
+
+    # Build RAG chain: retriever -> prompt -> model -> string
     rag_chain = (
         {"context": retriever, "question": RunnablePassthrough()}
-        | prompt
-        | model
-        | StrOutputParser()
+        | _ANSWER_CHAIN
     )
 
     return rag_chain
@@ -87,103 +228,140 @@ def process_youtube_video(video_id: str):
         return None, "Transcript is empty or unavailable."
 
     try:
-        rag_chain = build_rag_from_text(transcript_text)
-        return rag_chain, None
+        vectorstore, _ = build_vectorstore({video_id: transcript_text})
+        return build_rag_chain(vectorstore), None
     except Exception as e:
         return None, f"Failed to build RAG chain: {str(e)}"
 
 
 # -------- 5. Process multiple YouTube videos --------
-def process_multiple_youtube_videos(video_ids: list):
+def _fetch_and_embed(video_ids: list):
     """
-    Process multiple YouTube videos and create a unified RAG chain.
-    Returns (rag_chain, successful_videos, failed_videos, transcripts_dict).
-    transcripts_dict maps video_id -> transcript_text for successful videos.
+    Download transcripts and embed their chunks as one pipeline: each
+    transcript is split and its embedding batches queued as soon as it
+    arrives, so the remaining downloads overlap the earlier embeddings.
+    Returns (transcripts_dict, failed_videos, embedded, error_message), both
+    collections in the order of video_ids. embedded is (text_embeddings,
+    metadatas, ids, chunk_ids) as from _embed_transcripts, or None if
+    embedding failed.
     """
-    successful_videos = []
-    failed_videos = []
-    all_transcripts = []
     transcripts_dict = {}
+    errors = {}  # video_id -> error message
+    pending = {}  # video_id -> (chunks, metadatas, ids, embedding batch futures)
+
+    with ThreadPoolExecutor(max_workers=TRANSCRIPT_CONCURRENCY) as fetch_pool, \
+            ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY) as embed_pool:
+        fetches = {fetch_pool.submit(get_youtube_transcript, video_id): video_id for video_id in video_ids}
+
+        for future in as_completed(fetches):
+            video_id = fetches[future]
+            try:
+                transcript_text = future.result()
+            except Exception as e:
+                errors[video_id] = str(e)
+                continue
+
+            if not transcript_text.strip():
+                errors[video_id] = "Transcript is empty"
+                continue
+
+            transcripts_dict[video_id] = transcript_text
+            chunks, metadatas, ids = _split_transcript(video_id, transcript_text)
+            batches = [embed_pool.submit(DOC_EMBED.embed_documents, batch) for batch in _batches(chunks)]
+            pending[video_id] = (chunks, metadatas, ids, batches)
+
+    transcripts_dict = {video_id: transcripts_dict[video_id] for video_id in video_ids if video_id in transcripts_dict}
+    failed_videos = [{"video_id": video_id, "error": errors[video_id]} for video_id in video_ids if video_id in errors]
+
+    text_embeddings, all_metadatas, all_ids = [], [], []
+    chunk_ids = {}
+    try:
+        for video_id in transcripts_dict:
+            chunks, metadatas, ids, batches = pending[video_id]
+            vectors = [vector for batch in batches for vector in batch.result()]
+            text_embeddings.extend(zip(chunks, vectors))
+            all_metadatas.extend(metadatas)
+            all_ids.extend(ids)
+            chunk_ids[video_id] = ids
+    except Exception as e:
+        return transcripts_dict, failed_videos, None, str(e)
 
-    for video_id in video_ids:
-        try:
-            transcript_text = get_youtube_transcript(video_id)
-            if transcript_text.strip():
-                all_transcripts.append(transcript_text)
-                successful_videos.append(video_id)
-                transcripts_dict[video_id] = transcript_text
-            else:
-                failed_videos.append({"video_id": video_id, "error": "Transcript is empty"})
-        except Exception as e:
-            failed_videos.append({"video_id": video_id, "error": str(e)})
+    return transcripts_dict, failed_videos, (text_embeddings, all_metadatas, all_ids, chunk_ids), None
 
-    if not all_transcripts:
-        return None, [], failed_videos, {}
 
-    # Combine all transcripts into one text
-    combined_text = "\n\n--- NEW VIDEO ---\n\n".join(all_transcripts)
+def process_multiple_youtube_videos(video_ids: list):
+    """
+    Process multiple YouTube videos into one shared vector store, answered
+    from with retrieve_context/stream_answer.
+    Returns (vectorstore, chunk_ids, successful_videos, failed_videos, transcripts_dict).
+    transcripts_dict maps video_id -> transcript_text for successful videos,
+    chunk_ids maps video_id -> the vector store IDs of its chunks.
+    """
+    transcripts_dict, failed_videos, embedded, error = _fetch_and_embed(video_ids)
+    successful_videos = list(transcripts_dict)
+
+    if not transcripts_dict:
+        return None, {}, [], failed_videos, {}
+
+    if error:
+        return None, {}, successful_videos, failed_videos + [{"error": f"Failed to build vector store: {error}"}], transcripts_dict
 
     try:
-        rag_chain = build_rag_from_text(combined_text)
-        return rag_chain, successful_videos, failed_videos, transcripts_dict
+        text_embeddings, metadatas, ids, chunk_ids = embedded
+        vectorstore = _vectorstore_from_embeddings(text_embeddings, metadatas, ids)
+        return vectorstore, chunk_ids, successful_videos, failed_videos, transcripts_dict
     except Exception as e:
-        return None, successful_videos, failed_videos + [{"error": f"Failed to build RAG chain: {str(e)}"}], transcripts_dict
+        return None, {}, successful_videos, failed_videos + [{"error": f"Failed to build vector store: {str(e)}"}], transcripts_dict
 
 
 # -------- 5b. Add single video to existing transcripts --------
-def add_video_to_existing(transcripts_dict: dict, new_video_id: str):
+def add_video_to_existing(vectorstore, transcripts_dict: dict, new_video_id: str):
     """
-    Add a new video to existing transcripts and rebuild RAG chain.
-    Returns (rag_chain, success, error_message, updated_transcripts_dict).
+    Add a new video to existing transcripts, embedding only its own chunks
+    into the existing vector store (the RAG chain built on it stays valid).
+    Returns (success, error_message, updated_transcripts_dict, new_chunk_ids).
     """
     try:
         transcript_text = get_youtube_transcript(new_video_id)
         if not transcript_text.strip():
-            return None, False, "Transcript is empty", transcripts_dict
+            return False, "Transcript is empty", transcripts_dict, []
+
+        text_embeddings, metadatas, ids, _ = _embed_transcripts({new_video_id: transcript_text})
+        vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
 
         # Add new transcript to dictionary
         updated_transcripts = transcripts_dict.copy()
         updated_transcripts[new_video_id] = transcript_text
-
-        # Combine all transcripts
-        all_transcripts = list(updated_transcripts.values())
-        combined_text = "\n\n--- NEW VIDEO ---\n\n".join(all_transcripts)
-
-        # Build new RAG chain
-        rag_chain = build_rag_from_text(combined_text)
-        return rag_chain, True, None, updated_transcripts
+        return True, None, updated_transcripts, ids
 
     except Exception as e:
-        return None, False, str(e), transcripts_dict
+        return False, str(e), transcripts_dict, []
 
 
-# -------- 5c. Remove video and rebuild RAG chain --------
-def remove_video_and_rebuild(transcripts_dict: dict, video_id_to_remove: str):
+# -------- 5c. Remove video from the vector store --------
+def remove_video_chunks(vectorstore, transcripts_dict: dict, video_id_to_remove: str, chunk_ids: list):
     """
-    Remove a video from transcripts and rebuild RAG chain.
-    Returns (rag_chain, updated_transcripts_dict, error_message).
+    Remove a video from transcripts and delete its chunks (chunk_ids, as
+    recorded when it was added) from the vector store in place; nothing is
+    re-embedded and the RAG chain is unchanged.
+    Returns (updated_transcripts_dict, error_message).
     """
     if video_id_to_remove not in transcripts_dict:
-        return None, transcripts_dict, f"Video {video_id_to_remove} not found"
+        return transcripts_dict, f"Video {video_id_to_remove} not found"
 
     # Remove the video
     updated_transcripts = transcripts_dict.copy()
     del updated_transcripts[video_id_to_remove]
 
     if not updated_transcripts:
-        return None, {}, "Cannot remove last video"
+        return transcripts_dict, "Cannot remove last video"
 
     try:
-        # Combine remaining transcripts
-        all_transcripts = list(updated_transcripts.values())
-        combined_text = "\n\n--- NEW VIDEO ---\n\n".join(all_transcripts)
-
-        # Build new RAG chain
-        rag_chain = build_rag_from_text(combined_text)
-        return rag_chain, updated_transcripts, None
+        vectorstore.delete(chunk_ids)
+        return updated_transcripts, None
 
     except Exception as e:
-        return None, transcripts_dict, f"Failed to rebuild RAG chain: {str(e)}"
+        return transcripts_dict, f"Failed to remove video chunks: {str(e)}"
 
 
 # -------- 6. Query the RAG chain --------
@@ -199,6 +377,56 @@ def query_rag_chain(rag_chain, question: str):
         return None, f"Error while querying: {str(e)}"
 
 
+def retrieve_context(vectorstore, question: str, question_embedding=None):
+    """
+    Return the transcript chunks most relevant to a question, the same ones
+    the RAG chain's retriever would pick. Pass question_embedding when it is
+    already known to skip embedding the question again.
+    Kept apart from answering so callers can serialize just the index search.
+    """
+    if question_embedding is not None:
+        return vectorstore.similarity_search_by_vector(question_embedding, k=RETRIEVER_K)
+    return vectorstore.similarity_search(question, k=RETRIEVER_K)
+
+
+async def stream_answer(question: str, context):
+    """
+    Answer a question from chunks returned by retrieve_context, yielding the
+    answer as it is generated. Errors are raised to the caller.
+    """
+    async for chunk in _ANSWER_CHAIN.astream({"context": context, "question": question}):
+        yield chunk
+
+
+# -------- 6b. Embed a question for the semantic cache --------
+def embed_question(question: str):
+    """
+    Embed a question with the same model used by the retriever.
+    Returns (embedding, error_message).
+    """
+    try:
+        embedding = EMBED.embed_query(question)
+        return embedding, None
+    except Exception as e:
+        return None, f"Failed to embed question: {str(e)}"
+
+
+# -------- 6c. Persist vector store to disk --------
+def save_vectorstore(vectorstore, path: str):
+    """Write the FAISS index and its docstore to a directory."""
+    vectorstore.save_local(path)
+
+
+def load_vectorstore(path: str):
+    """Load a vector store written by save_vectorstore."""
+    return FAISS.load_local(
+        path,
+        EMBED,
+        allow_dangerous_deserialization=True,  # Only ever reads files we wrote
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+    )
+
+
 # -------- 7. CLI Chat loop (original functionality) --------
 def chat_over_youtube(video_id: str):
     print(f"🎥 Building RAG for YouTube video: {video_id}")
@@ -0,0 +1,75 @@
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Bounded in-memory cache of question embedding -> answer.
+
+    A lookup hits when a previous question asked against the same set of
+    videos (the session key) has cosine similarity >= threshold with the new
+    one. Each session key gets its own FAISS index holding L2-normalized
+    embeddings quantized to float16, which halves the bytes scanned per
+    lookup. The rounding is lossy but shifts similarities by only ~1e-5,
+    which is negligible at the 0.95 threshold. Least recently used entries
+    are evicted once max_entries is reached.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 4096):
+        self.threshold = threshold
+        self.max_entries = max_entries
+
+        self._indexes = {}  # session_key -> faiss.IndexIDMap2
+        self._entries = OrderedDict()  # entry_id -> (question, answer, session_key), oldest first
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.array(embedding, dtype=np.float32, ndmin=2)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def lookup(self, embedding, session_key):
+        """
+        Return the cached answer for the most similar question asked with the
+        same session_key, or None if nothing is similar enough.
+        """
+        index = self._indexes.get(session_key)
+        if index is None:
+            return None
+
+        sims, ids = index.search(self._normalize(embedding), 1)
+        if sims[0, 0] < self.threshold:
+            return None
+
+        entry_id = int(ids[0, 0])
+        self._entries.move_to_end(entry_id)
+        return self._entries[entry_id][1]
+
+    def insert(self, embedding, question: str, answer: str, session_key):
+        """Store an answer, evicting the least recently used entry if full."""
+        vector = self._normalize(embedding)
+
+        if len(self._entries) >= self.max_entries:
+            old_id, (_, _, old_key) = self._entries.popitem(last=False)
+            old_index = self._indexes[old_key]
+            old_index.remove_ids(np.array([old_id], dtype=np.int64))
+            if old_index.ntotal == 0:
+                del self._indexes[old_key]
+
+        index = self._indexes.get(session_key)
+        if index is None:
+            index = faiss.IndexIDMap2(faiss.IndexScalarQuantizer(
+                vector.shape[1], faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT
+            ))
+            self._indexes[session_key] = index
+
+        entry_id = self._next_id
+        self._next_id += 1
+        index.add_with_ids(vector, np.array([entry_id], dtype=np.int64))
+        self._entries[entry_id] = (question, answer, session_key)
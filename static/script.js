@@ -17,6 +17,17 @@ const toggleManageBtn = document.getElementById('toggleManageBtn');
 const manageControls = document.getElementById('manageControls');
 const videoCountText = document.getElementById('videoCountText');
 
+// Session ID sent with every request so the server keeps this browser's videos apart
+const sessionId = localStorage.getItem('sessionId') || newSessionId();
+localStorage.setItem('sessionId', sessionId);
+
+// crypto.randomUUID only exists on HTTPS/localhost; getRandomValues also works over plain HTTP
+function newSessionId() {
+    if (crypto.randomUUID) return crypto.randomUUID();
+    const bytes = crypto.getRandomValues(new Uint8Array(16));
+    return Array.from(bytes, (b) => b.toString(16).padStart(2, '0')).join('');
+}
+
 let currentVideoIds = [];
 let inputCounter = 0;
 let isManagementExpanded = false;
@@ -107,6 +118,7 @@ async function loadVideo() {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
+                'X-Session-Id': sessionId,
             },
             body: JSON.stringify({ urls }),
         });
@@ -114,7 +126,7 @@ async function loadVideo() {
         const data = await response.json();
 
         if (!response.ok) {
-            throw new Error(data.detail || 'Failed to process videos');
+            throw new Error(errorDetail(data, 'Failed to process videos'));
         }
 
         // Success
@@ -177,18 +189,27 @@ async function sendQuestion() {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
+                'X-Session-Id': sessionId,
             },
             body: JSON.stringify({ question }),
         });
 
-        const data = await response.json();
-
         if (!response.ok) {
-            throw new Error(data.detail || 'Failed to get response');
+            const data = await response.json();
+            throw new Error(errorDetail(data, 'Failed to get response'));
         }
 
-        // Add AI response to chat
-        addMessage(data.answer, 'ai');
+        // Stream the AI response into the chat as it arrives
+        const content = addMessage('', 'ai');
+        await readEventStream(response, (event) => {
+            if (event.error) {
+                throw new Error(event.error);
+            }
+            if (event.token) {
+                content.textContent += event.token;
+                chatContainer.scrollTop = chatContainer.scrollHeight;
+            }
+        });
 
     } catch (error) {
         addMessage(`Error: ${error.message}`, 'ai');
@@ -199,7 +220,38 @@ async function sendQuestion() {
     }
 }
 
-// Add Message to Chat
+// Error message from a failed response; request validation errors (422)
+// carry a list of {msg} objects instead of a string
+function errorDetail(data, fallback) {
+    if (Array.isArray(data.detail)) {
+        return data.detail.map(d => d.msg).join('; ');
+    }
+    return data.detail || fallback;
+}
+
+// Read a Server-Sent Events response body, calling onEvent with each parsed message
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const messages = buffer.split('\n\n');
+        buffer = messages.pop();
+
+        for (const message of messages) {
+            if (message.startsWith('data: ')) {
+                onEvent(JSON.parse(message.slice(6)));
+            }
+        }
+    }
+}
+
+// Add Message to Chat (returns the content element so it can be updated)
 function addMessage(text, type) {
     // Remove welcome message if it exists
     const welcomeMsg = chatContainer.querySelector('.welcome-message');
@@ -227,6 +279,8 @@ function addMessage(text, type) {
 
     // Scroll to bottom
     chatContainer.scrollTop = chatContainer.scrollHeight;
+
+    return content;
 }
 
 // Show Status Message
@@ -323,6 +377,7 @@ async function addVideoToSession() {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
+                'X-Session-Id': sessionId,
             },
             body: JSON.stringify({ url }),
         });
@@ -330,7 +385,7 @@ async function addVideoToSession() {
         const data = await response.json();
 
         if (!response.ok) {
-            throw new Error(data.detail || 'Failed to add video');
+            throw new Error(errorDetail(data, 'Failed to add video'));
         }
 
         // Update video IDs
@@ -371,6 +426,7 @@ async function removeVideoFromSession(videoId) {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
+                'X-Session-Id': sessionId,
             },
             body: JSON.stringify({ video_id: videoId }),
         });
@@ -378,7 +434,7 @@ async function removeVideoFromSession(videoId) {
         const data = await response.json();
 
         if (!response.ok) {
-            throw new Error(data.detail || 'Failed to remove video');
+            throw new Error(errorDetail(data, 'Failed to remove video'));
         }
 
         // Update video IDs